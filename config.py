@@ -3,14 +3,21 @@ Configuration management for vLLM PoC
 Handles platform-specific settings and environment detection.
 """
 
+import ctypes
+import logging
 import os
 import platform
 import subprocess
 import sys
+from functools import cached_property
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
 from pathlib import Path
 
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class PlatformConfig:
@@ -50,8 +57,30 @@ class ConfigManager:
         else:
             return "unknown"
     
+    def _nvml_device_count(self) -> Optional[int]:
+        """Count NVIDIA GPUs via NVML, or return None if NVML can't be loaded or initialized."""
+        lib_name = "nvml.dll" if self.platform == "windows" else "libnvidia-ml.so.1"
+        try:
+            nvml = ctypes.CDLL(lib_name)
+            if nvml.nvmlInit_v2() != 0:
+                return None
+        except (OSError, AttributeError):
+            return None
+        try:
+            count = ctypes.c_uint(0)
+            if nvml.nvmlDeviceGetCount_v2(ctypes.byref(count)) != 0:
+                return 0
+            return count.value
+        finally:
+            nvml.nvmlShutdown()
+    
+    @cached_property
     def _has_cuda(self) -> bool:
         """Check if CUDA is available."""
+        # Loading NVML in-process is much cheaper than spawning nvidia-smi
+        device_count = self._nvml_device_count()
+        if device_count is not None:
+            return device_count > 0
         try:
             result = subprocess.run(
                 ["nvidia-smi"], 
@@ -63,6 +92,7 @@ class ConfigManager:
         except (subprocess.TimeoutExpired, FileNotFoundError):
             return False
     
+    @cached_property
     def _has_mps(self) -> bool:
         """Check if MPS (Metal Performance Shaders) is available on macOS."""
         if not self.platform.startswith("macos"):
@@ -74,61 +104,63 @@ class ConfigManager:
             return False
     
     def _get_platform_config(self) -> PlatformConfig:
-        """Get platform-specific configuration."""
-        configs = {
-            "macos_apple_silicon": PlatformConfig(
-                name="macOS Apple Silicon",
-                supports_cuda=False,
-                supports_mps=True,
-                vllm_backend="cpu",  # vLLM on macOS typically runs on CPU
-                installation_method="pip_source",
-                requirements_file="requirements-macos.txt",
-                docker_base_image="python:3.11-slim",
-                additional_setup=[
-                    "brew install cmake",
-                    "export MACOSX_DEPLOYMENT_TARGET=11.0",
-                    "pip install torch torchvision torchaudio"
-                ]
-            ),
-            "macos_intel": PlatformConfig(
-                name="macOS Intel",
-                supports_cuda=False,
-                supports_mps=False,
-                vllm_backend="cpu",
-                installation_method="pip_source",
-                requirements_file="requirements-macos.txt",
-                docker_base_image="python:3.11-slim",
-                additional_setup=[
-                    "brew install cmake",
-                    "pip install torch torchvision torchaudio"
-                ]
-            ),
-            "linux": PlatformConfig(
-                name="Linux",
-                supports_cuda=self._has_cuda(),
-                supports_mps=False,
-                vllm_backend="cuda" if self._has_cuda() else "cpu",
-                installation_method="pip",
-                requirements_file="requirements.txt",
-                docker_base_image="nvidia/cuda:12.1-devel-ubuntu22.04",
-                additional_setup=[]
-            ),
-            "windows": PlatformConfig(
-                name="Windows",
-                supports_cuda=self._has_cuda(),
-                supports_mps=False,
-                vllm_backend="cuda" if self._has_cuda() else "cpu",
-                installation_method="pip",
-                requirements_file="requirements-windows.txt",
-                docker_base_image="mcr.microsoft.com/windows/servercore:ltsc2022",
-                additional_setup=[
-                    "Install Visual Studio Build Tools",
-                    "Install CUDA Toolkit if GPU acceleration needed"
-                ]
-            )
-        }
-        
-        return configs.get(self.platform, configs["linux"])
+        """Get platform-specific configuration, building only the detected platform's entry."""
+        match self.platform:
+            case "macos_apple_silicon":
+                return PlatformConfig(
+                    name="macOS Apple Silicon",
+                    supports_cuda=False,
+                    supports_mps=True,
+                    vllm_backend="cpu",  # vLLM on macOS typically runs on CPU
+                    installation_method="pip_source",
+                    requirements_file="requirements-macos.txt",
+                    docker_base_image="python:3.11-slim",
+                    additional_setup=[
+                        "brew install cmake",
+                        "export MACOSX_DEPLOYMENT_TARGET=11.0",
+                        "pip install torch torchvision torchaudio"
+                    ]
+                )
+            case "macos_intel":
+                return PlatformConfig(
+                    name="macOS Intel",
+                    supports_cuda=False,
+                    supports_mps=False,
+                    vllm_backend="cpu",
+                    installation_method="pip_source",
+                    requirements_file="requirements-macos.txt",
+                    docker_base_image="python:3.11-slim",
+                    additional_setup=[
+                        "brew install cmake",
+                        "pip install torch torchvision torchaudio"
+                    ]
+                )
+            case "windows":
+                return PlatformConfig(
+                    name="Windows",
+                    supports_cuda=self._has_cuda,
+                    supports_mps=False,
+                    vllm_backend="cuda" if self._has_cuda else "cpu",
+                    installation_method="pip",
+                    requirements_file="requirements-windows.txt",
+                    docker_base_image="mcr.microsoft.com/windows/servercore:ltsc2022",
+                    additional_setup=[
+                        "Install Visual Studio Build Tools",
+                        "Install CUDA Toolkit if GPU acceleration needed"
+                    ]
+                )
+            case _:
+                # Linux, and the fallback for unrecognized platforms
+                return PlatformConfig(
+                    name="Linux",
+                    supports_cuda=self._has_cuda,
+                    supports_mps=False,
+                    vllm_backend="cuda" if self._has_cuda else "cpu",
+                    installation_method="pip",
+                    requirements_file="requirements.txt",
+                    docker_base_image="nvidia/cuda:12.1-devel-ubuntu22.04",
+                    additional_setup=[]
+                )
     
     def _load_environment_variables(self) -> Dict[str, Any]:
         """Load environment variables with defaults."""
@@ -142,6 +174,10 @@ class ConfigManager:
             "TRUST_REMOTE_CODE": os.getenv("TRUST_REMOTE_CODE", "true").lower() == "true",
             "ENFORCE_EAGER": os.getenv("ENFORCE_EAGER", "false").lower() == "true",
             "DISABLE_CUSTOM_ALL_REDUCE": os.getenv("DISABLE_CUSTOM_ALL_REDUCE", "false").lower() == "true",
+            "MAX_BATCH_SIZE": int(os.getenv("MAX_BATCH_SIZE", "32")),
+            "MAX_BATCH_DELAY": float(os.getenv("MAX_BATCH_DELAY", "0.05")),
+            "DEMO_DELAY": float(os.getenv("DEMO_DELAY", "0")),
+            "CORS_ALLOW_ORIGINS": [origin.strip() for origin in os.getenv("CORS_ALLOW_ORIGINS", "*").split(",")],
         }
     
     def _get_default_model(self) -> str:
@@ -154,6 +190,11 @@ class ConfigManager:
     
     def get_vllm_args(self) -> Dict[str, Any]:
         """Get vLLM engine arguments based on platform."""
+        return dict(self._vllm_args)
+    
+    @cached_property
+    def _vllm_args(self) -> Dict[str, Any]:
+        """Build the vLLM engine arguments once; env vars and platform are fixed after startup."""
         base_args = {
             "model": self.env_vars["MODEL_NAME"],
             "tensor_parallel_size": self.env_vars["TENSOR_PARALLEL_SIZE"],
@@ -165,6 +206,8 @@ class ConfigManager:
             base_args.update({
                 "gpu_memory_utilization": self.env_vars["GPU_MEMORY_UTILIZATION"],
                 "dtype": "auto",
+                # Reuse KV cache blocks across requests that share a conversation prefix
+                "enable_prefix_caching": True,
             })
         else:
             # CPU-specific optimizations
@@ -244,44 +287,48 @@ pip install vllm
         
         return validation
     
-    def print_platform_info(self):
-        """Print platform and configuration information."""
-        print(f"🖥️  Platform: {self.config.name}")
-        print(f"🔧 Backend: {self.config.vllm_backend}")
-        print(f"🎯 CUDA Support: {'✅' if self.config.supports_cuda else '❌'}")
-        print(f"🍎 MPS Support: {'✅' if self.config.supports_mps else '❌'}")
-        print(f"📦 Requirements: {self.config.requirements_file}")
-        print(f"🐳 Docker Base: {self.config.docker_base_image}")
+    def log_platform_info(self):
+        """Log platform and configuration information."""
+        logger.info(f"Platform: {self.config.name}")
+        logger.info(f"Backend: {self.config.vllm_backend}")
+        logger.info(f"CUDA Support: {'yes' if self.config.supports_cuda else 'no'}")
+        logger.info(f"MPS Support: {'yes' if self.config.supports_mps else 'no'}")
+        logger.info(f"Requirements: {self.config.requirements_file}")
+        logger.info(f"Docker Base: {self.config.docker_base_image}")
         
         if self.config.additional_setup:
-            print("🛠️  Additional Setup Required:")
+            logger.info("Additional Setup Required:")
             for step in self.config.additional_setup:
-                print(f"   - {step}")
+                logger.info(f"   - {step}")
 
 
-# Global config instance
-config = ConfigManager()
+# Global config instance, created on first use so importing this module doesn't probe hardware
+_config: Optional[ConfigManager] = None
 
 
 def get_config() -> ConfigManager:
     """Get the global configuration instance."""
-    return config
+    global _config
+    if _config is None:
+        _config = ConfigManager()
+    return _config
 
 
 if __name__ == "__main__":
+    configure_logging(fmt="%(message)s")
     config = ConfigManager()
-    config.print_platform_info()
+    config.log_platform_info()
     
-    print("\n📋 Environment Validation:")
+    logger.info("Environment Validation:")
     validation = config.validate_environment()
     for key, value in validation.items():
         if key != "recommendations":
-            print(f"   {key}: {value}")
+            logger.info(f"   {key}: {value}")
     
     if validation["recommendations"]:
-        print("\n💡 Recommendations:")
+        logger.info("Recommendations:")
         for rec in validation["recommendations"]:
-            print(f"   - {rec}")
+            logger.info(f"   - {rec}")
     
-    print(f"\n🚀 Installation Command:")
-    print(config.get_installation_command())
\ No newline at end of file
+    logger.info("Installation Command:")
+    logger.info(config.get_installation_command())
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Minimal CORS middleware for the vLLM PoC servers.
+Answers preflight requests without routing and tags responses for allowed origins.
+"""
+
+from typing import Iterable, List, Tuple
+
+# Static part of every preflight answer; only the echoed origin varies
+_PREFLIGHT_HEADERS: List[Tuple[bytes, bytes]] = [
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"Authorization, Content-Type, X-Request-ID"),
+    (b"access-control-allow-credentials", b"true"),
+    (b"access-control-max-age", b"600"),
+    (b"vary", b"Origin"),
+    (b"content-length", b"0"),
+]
+
+# Added to regular responses for allowed origins
+_RESPONSE_HEADERS: List[Tuple[bytes, bytes]] = [
+    (b"access-control-allow-credentials", b"true"),
+    (b"access-control-expose-headers", b"X-Request-ID"),
+    (b"vary", b"Origin"),
+]
+
+
+class CORSAllowlistMiddleware:
+    """Pure ASGI CORS handling for a fixed origin allowlist ("*" allows any origin)."""
+    
+    def __init__(self, app, allow_origins: Iterable[str] = ("*",)):
+        self.app = app
+        self.allow_origins = frozenset(origin.encode("latin-1") for origin in allow_origins)
+        self.allow_any = b"*" in self.allow_origins
+    
+    def _allowed(self, origin: bytes) -> bool:
+        return self.allow_any or origin in self.allow_origins
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        origin = None
+        is_preflight = False
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                is_preflight = scope["method"] == "OPTIONS"
+        
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+        
+        allowed = self._allowed(origin)
+        if is_preflight:
+            # Answer without touching the router; credentials require echoing the origin
+            if allowed:
+                status, headers = 204, [(b"access-control-allow-origin", origin), *_PREFLIGHT_HEADERS]
+            else:
+                status, headers = 403, [(b"content-length", b"0")]
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        if not allowed:
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (b"access-control-allow-origin", origin),
+                    *_RESPONSE_HEADERS,
+                ]
+            await send(message)
+        
+        await self.app(scope, receive, send_with_cors)
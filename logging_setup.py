@@ -0,0 +1,32 @@
+"""
+Logging setup for the vLLM PoC.
+Log calls only enqueue records; a background listener thread formats and writes them.
+"""
+
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: int = logging.INFO, fmt: str = "%(asctime)s %(levelname)s %(name)s: %(message)s"):
+    """Route the root logger through a queue to a stderr handler; later calls are no-ops."""
+    global _listener
+    if _listener is not None:
+        return
+
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
+
+    _listener = QueueListener(records, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -5,39 +5,56 @@ Automatically detects platform and sets up the appropriate environment.
 """
 
 import sys
+import logging
+import shlex
+import shutil
 import subprocess
 import os
 from pathlib import Path
+from typing import List, Union
 
 # Add parent directory to path to import config
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from config import ConfigManager
+from logging_setup import configure_logging
 
+logger = logging.getLogger(__name__)
 
-def run_command(command: str, check: bool = True) -> subprocess.CompletedProcess:
-    """Run a shell command and return the result."""
-    print(f"🔄 Running: {command}")
-    result = subprocess.run(command, shell=True, capture_output=True, text=True)
+
+# Python inside the project virtual environment; calling it directly needs no activation
+VENV_PYTHON = Path("venv") / ("Scripts/python.exe" if sys.platform == "win32" else "bin/python")
+
+
+def run_command(command: Union[str, List[str]], check: bool = True) -> subprocess.CompletedProcess:
+    """Run a command without a shell, streaming its output, and return the result."""
+    args = shlex.split(command) if isinstance(command, str) else [str(arg) for arg in command]
+    logger.info(f"Running: {shlex.join(args)}")
+    try:
+        result = subprocess.run(args)
+    except FileNotFoundError:
+        logger.info(f"   Not found: {args[0]}")
+        result = subprocess.CompletedProcess(args, returncode=127)
     
     if check and result.returncode != 0:
-        print(f"❌ Command failed: {command}")
-        print(f"   Error: {result.stderr}")
+        logger.error(f"Command failed: {shlex.join(args)}")
         sys.exit(1)
     
-    if result.stdout:
-        print(f"   Output: {result.stdout.strip()}")
-    
     return result
 
 
+def pip_install(*args: str, check: bool = True) -> subprocess.CompletedProcess:
+    """Run pip install inside the project virtual environment."""
+    return run_command([VENV_PYTHON, "-m", "pip", "install", *args], check=check)
+
+
 def setup_virtual_environment():
     """Set up Python virtual environment."""
     if not os.path.exists("venv"):
-        print("📦 Creating virtual environment...")
-        run_command("python3 -m venv venv")
+        logger.info("Creating virtual environment...")
+        run_command([sys.executable, "-m", "venv", "venv"])
     else:
-        print("✅ Virtual environment already exists")
+        logger.info("Virtual environment already exists")
 
 
 def install_requirements(config_manager: ConfigManager):
@@ -45,48 +62,47 @@ def install_requirements(config_manager: ConfigManager):
     requirements_file = config_manager.config.requirements_file
     
     if not os.path.exists(requirements_file):
-        print(f"⚠️  Requirements file {requirements_file} not found, using default")
+        logger.warning(f"Requirements file {requirements_file} not found, using default")
         requirements_file = "requirements-simple.txt"
     
-    print(f"📦 Installing requirements from {requirements_file}...")
-    
-    # Activate virtual environment and install requirements
-    if sys.platform == "win32":
-        activate_cmd = "venv\\Scripts\\activate"
-    else:
-        activate_cmd = "source venv/bin/activate"
-    
-    install_cmd = f"{activate_cmd} && pip install --upgrade pip && pip install -r {requirements_file}"
+    logger.info(f"Installing requirements from {requirements_file}...")
     
     try:
-        run_command(install_cmd)
-        print("✅ Requirements installed successfully")
+        pip_install("--upgrade", "pip")
+        pip_install("-r", requirements_file)
+        logger.info("Requirements installed successfully")
     except SystemExit:
-        print("⚠️  Some packages failed to install, trying simplified installation...")
+        logger.warning("Some packages failed to install, trying simplified installation...")
         
         # Try installing basic requirements first
-        basic_cmd = f"{activate_cmd} && pip install fastapi uvicorn pydantic"
-        run_command(basic_cmd)
+        pip_install("fastapi", "uvicorn", "pydantic")
         
         # Try vLLM with specific flags for macOS
         if config_manager.platform.startswith("macos"):
-            vllm_cmd = f"{activate_cmd} && pip install vllm --no-build-isolation || pip install vllm --no-deps"
-            run_command(vllm_cmd, check=False)
+            if pip_install("vllm", "--no-build-isolation", check=False).returncode != 0:
+                pip_install("vllm", "--no-deps", check=False)
 
 
 def setup_platform_specific(config_manager: ConfigManager):
     """Run platform-specific setup commands."""
-    print(f"🛠️  Running platform-specific setup for {config_manager.config.name}...")
+    logger.info(f"Running platform-specific setup for {config_manager.config.name}...")
     
     for command in config_manager.config.additional_setup:
-        print(f"   📋 {command}")
+        logger.info(f"   {command}")
+        if command.startswith("export "):
+            # Without a shell, exports go into our environment so later installs inherit them
+            name, _, value = command[len("export "):].partition("=")
+            os.environ[name] = value
+            continue
+        if command.startswith("pip "):
+            pip_install(*shlex.split(command)[2:], check=False)
+            continue
         if command.startswith("brew"):
             # Check if Homebrew is installed on macOS
             if config_manager.platform.startswith("macos"):
-                result = run_command("which brew", check=False)
-                if result.returncode != 0:
-                    print("   ⚠️  Homebrew not found. Please install Homebrew first:")
-                    print("   /bin/bash -c \"$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)\"")
+                if shutil.which("brew") is None:
+                    logger.warning("   Homebrew not found. Please install Homebrew first:")
+                    logger.info("   /bin/bash -c \"$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)\"")
                     continue
         
         # Run the command (non-critical)
@@ -95,21 +111,21 @@ def setup_platform_specific(config_manager: ConfigManager):
 
 def validate_installation(config_manager: ConfigManager):
     """Validate the installation."""
-    print("🔍 Validating installation...")
+    logger.info("Validating installation...")
     
     validation = config_manager.validate_environment()
     
-    print(f"   Platform: {validation['platform']}")
-    print(f"   Python: {validation['python_version']}")
-    print(f"   PyTorch: {'✅' if validation['torch_available'] else '❌'}")
-    print(f"   CUDA: {'✅' if validation['cuda_available'] else '❌'}")
-    print(f"   MPS: {'✅' if validation['mps_available'] else '❌'}")
-    print(f"   vLLM: {'✅' if validation['vllm_available'] else '❌'}")
+    logger.info(f"   Platform: {validation['platform']}")
+    logger.info(f"   Python: {validation['python_version']}")
+    logger.info(f"   PyTorch: {'yes' if validation['torch_available'] else 'no'}")
+    logger.info(f"   CUDA: {'yes' if validation['cuda_available'] else 'no'}")
+    logger.info(f"   MPS: {'yes' if validation['mps_available'] else 'no'}")
+    logger.info(f"   vLLM: {'yes' if validation['vllm_available'] else 'no'}")
     
     if validation["recommendations"]:
-        print("💡 Recommendations:")
+        logger.info("Recommendations:")
         for rec in validation["recommendations"]:
-            print(f"   - {rec}")
+            logger.info(f"   - {rec}")
     
     return validation
 
@@ -120,7 +136,7 @@ def create_run_script(config_manager: ConfigManager):
         script_name = "run.bat"
         script_content = f"""@echo off
 call venv\\Scripts\\activate
-echo 🚀 Starting vLLM PoC Server...
+echo Starting vLLM PoC Server...
 python app.py
 pause
 """
@@ -128,7 +144,7 @@ pause
         script_name = "run.sh"
         script_content = f"""#!/bin/bash
 source venv/bin/activate
-echo "🚀 Starting vLLM PoC Server..."
+echo "Starting vLLM PoC Server..."
 python app.py
 """
     
@@ -138,19 +154,20 @@ python app.py
     if not sys.platform == "win32":
         os.chmod(script_name, 0o755)
     
-    print(f"✅ Created run script: {script_name}")
+    logger.info(f"Created run script: {script_name}")
 
 
 def main():
     """Main setup function."""
-    print("🚀 vLLM PoC Platform Setup")
-    print("=" * 50)
+    configure_logging(fmt="%(message)s")
+    logger.info("vLLM PoC Platform Setup")
+    logger.info("=" * 50)
     
     # Initialize configuration
     config_manager = ConfigManager()
-    config_manager.print_platform_info()
+    config_manager.log_platform_info()
     
-    print("\n📋 Setup Steps:")
+    logger.info("\nSetup Steps:")
     
     # Step 1: Virtual environment
     setup_virtual_environment()
@@ -168,29 +185,29 @@ def main():
     create_run_script(config_manager)
     
     # Final instructions
-    print("\n🎉 Setup Complete!")
-    print("=" * 50)
+    logger.info("\nSetup Complete!")
+    logger.info("=" * 50)
     
     if validation["vllm_available"]:
-        print("✅ vLLM is available - you can run the full server")
+        logger.info("vLLM is available - you can run the full server")
     else:
-        print("⚠️  vLLM not available - server will run in demo mode")
+        logger.warning("vLLM not available - server will run in demo mode")
     
-    print("\n🚀 To start the server:")
+    logger.info("\nTo start the server:")
     if sys.platform == "win32":
-        print("   run.bat")
+        logger.info("   run.bat")
     else:
-        print("   ./run.sh")
+        logger.info("   ./run.sh")
     
-    print("\n📡 Or manually:")
+    logger.info("\nOr manually:")
     if sys.platform == "win32":
-        print("   venv\\Scripts\\activate")
+        logger.info("   venv\\Scripts\\activate")
     else:
-        print("   source venv/bin/activate")
-    print("   python app.py")
+        logger.info("   source venv/bin/activate")
+    logger.info("   python app.py")
     
-    print(f"\n🌐 Server will be available at: http://localhost:{config_manager.env_vars['PORT']}")
-    print(f"📚 API documentation: http://localhost:{config_manager.env_vars['PORT']}/docs")
+    logger.info(f"\nServer will be available at: http://localhost:{config_manager.env_vars['PORT']}")
+    logger.info(f"API documentation: http://localhost:{config_manager.env_vars['PORT']}/docs")
 
 
 if __name__ == "__main__":
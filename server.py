@@ -0,0 +1,575 @@
+"""
+vLLM PoC server factory
+Builds the FastAPI app shared by the vLLM entrypoint (app.py) and the demo entrypoint (app_simple.py).
+"""
+
+import os
+import random
+import asyncio
+import logging
+from types import SimpleNamespace
+from typing import Callable, List, Dict, Any, Literal, Optional, Set, Tuple
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
+from uuid import uuid4
+
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+import orjson
+
+# Import configuration
+from config import ConfigManager, get_config
+from cors import CORSAllowlistMiddleware
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Import vLLM components with error handling for different platforms
+try:
+    from vllm import SamplingParams
+    from vllm.engine.arg_utils import AsyncEngineArgs
+    from vllm.engine.async_llm_engine import AsyncLLMEngine
+    VLLM_AVAILABLE = True
+    _vllm_import_error: Optional[ImportError] = None
+except ImportError as e:
+    VLLM_AVAILABLE = False
+    _vllm_import_error = e
+    # Stand-ins for demo mode; the engine itself is DemoEngine below
+    class SamplingParams:
+        def __init__(self, **kwargs):
+            self.params = kwargs
+    
+    AsyncEngineArgs = None
+    AsyncLLMEngine = Any  # Only used in annotations without vLLM
+
+
+class DemoTokenizer:
+    """Byte-level stand-in for the model tokenizer."""
+    def encode(self, text, add_special_tokens=True):
+        return list(text.encode("utf-8"))
+    
+    def decode(self, token_ids):
+        return bytes(token_ids).decode("utf-8", errors="replace")
+
+
+# Demo replies, formatted with the last user message
+_DEMO_TEMPLATES = (
+    "Hello! You said: '{}'. This is a demo response from the vLLM PoC server.",
+    "I received your message: '{}'. In a real deployment, this would be processed by vLLM.",
+    "Demo mode: Your input was '{}'. The actual vLLM would generate a more sophisticated response.",
+)
+
+
+class DemoEngine:
+    """In-process engine with the same generate() contract as AsyncLLMEngine, for running without vLLM."""
+    
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.tokenizer = DemoTokenizer()
+    
+    async def get_tokenizer(self):
+        return self.tokenizer
+    
+    async def abort(self, request_id):
+        # Demo replies are produced in a single step, so there is nothing to cancel
+        pass
+    
+    async def generate(self, prompt, sampling_params, request_id):
+        # Simulate processing time
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        prompt_token_ids = prompt["prompt_token_ids"]
+        text = self.tokenizer.decode(prompt_token_ids)
+        user_message = text.rpartition(ROLE_PREFIX["user"])[2].rpartition("\nAssistant:")[0]
+        reply = random.choice(_DEMO_TEMPLATES).format(user_message)
+        yield SimpleNamespace(
+            request_id=request_id,
+            finished=True,
+            prompt_token_ids=prompt_token_ids,
+            outputs=[SimpleNamespace(text=reply, token_ids=self.tokenizer.encode(reply))],
+        )
+
+
+class ChatMessage(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    role: str
+    content: str
+
+
+class ChatRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    messages: List[ChatMessage]
+    max_tokens: Optional[int] = 512
+    temperature: Optional[float] = 0.7
+    top_p: Optional[float] = 0.9
+    stream: Optional[bool] = False
+
+
+class ChatResponse(BaseModel):
+    id: str
+    choices: List[Dict[str, Any]]
+    usage: Dict[str, int]
+
+
+class HealthResponse(BaseModel):
+    status: str
+    model: str
+    gpu_memory_used: Optional[str] = None
+
+
+# Compiled once; validates the raw request body without an intermediate dict
+_chat_request_adapter = TypeAdapter(ChatRequest)
+
+
+def _inline_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve local $defs references so a model schema can be embedded in openapi_extra."""
+    defs = schema.pop("$defs", {})
+    
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(defs[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+    
+    return resolve(schema)
+
+
+# Strong references to in-flight batches so they aren't garbage collected mid-generation
+_batch_tasks: Set[asyncio.Task] = set()
+
+
+# Turn prefixes for the plain-text chat format; roles not listed here are dropped
+ROLE_PREFIX = {"user": "User: ", "assistant": "Assistant: "}
+
+
+def _format_turns(turns) -> str:
+    """Render (role, content) turns in the plain-text chat format the model expects."""
+    parts: List[str] = []
+    for role, content in turns:
+        prefix = ROLE_PREFIX.get(role)
+        if prefix is not None:
+            parts += (prefix, content, "\n")
+    return "".join(parts)
+
+
+def _make_prefix_encoder(tokenizer) -> Callable[[Tuple[Tuple[str, str], ...]], Tuple[int, ...]]:
+    """Build a cached encoder that tokenizes a conversation history once per tokenizer.
+
+    A history's tokens are those of the history one turn shorter plus the last
+    turn encoded on its own, so a follow-up request (previous messages plus the
+    assistant reply and a new user turn) only encodes its two newest turns.
+    Encoding turn by turn matches encoding the joined text for byte-level BPE
+    tokenizers; SentencePiece tokenizers may add a word-boundary marker at the
+    start of each turn, so their prompts can differ slightly from a one-shot encode.
+    """
+    @lru_cache(maxsize=1024)
+    def prefix_token_ids(turns: Tuple[Tuple[str, str], ...]) -> Tuple[int, ...]:
+        if not turns:
+            return tuple(tokenizer.encode(""))
+        last_turn = tokenizer.encode(_format_turns(turns[-1:]), add_special_tokens=False)
+        return prefix_token_ids(turns[:-1]) + tuple(last_turn)
+    return prefix_token_ids
+
+
+def build_prompt_token_ids(messages: List["ChatMessage"], tokenizer, prefix_token_ids) -> List[int]:
+    """Tokenize a chat request, reusing the cached tokens of everything but the last turn."""
+    history = tuple((m.role, m.content) for m in messages[:-1])
+    last_turn = _format_turns((m.role, m.content) for m in messages[-1:]) + "Assistant:"
+    return [*prefix_token_ids(history), *tokenizer.encode(last_turn, add_special_tokens=False)]
+
+
+async def _generate_one(engine: AsyncLLMEngine, request_id: str, prompt_token_ids: List[int], sampling_params: SamplingParams, future: asyncio.Future):
+    """Run a single generation to completion and resolve its future."""
+    prompt = {"prompt_token_ids": prompt_token_ids}
+    try:
+        final_output = None
+        async for request_output in engine.generate(prompt, sampling_params, request_id=request_id):
+            if request_output.finished:
+                final_output = request_output
+                break
+            if future.done():
+                # The caller gave up (client disconnected); stop consuming the stream
+                break
+        if not future.done():
+            future.set_result(final_output)
+    except asyncio.CancelledError:
+        if not future.done():
+            future.set_exception(HTTPException(status_code=503, detail="Server shutting down"))
+        raise
+    except Exception as e:
+        if not future.done():
+            future.set_exception(e)
+
+
+async def _stream_chat(engine: AsyncLLMEngine, request_id: str, prompt_token_ids: List[int], sampling_params: SamplingParams):
+    """Yield server-sent events carrying only the text generated since the previous event."""
+    prompt = {"prompt_token_ids": prompt_token_ids}
+    prev_len = 0
+    try:
+        async for request_output in engine.generate(prompt, sampling_params, request_id=request_id):
+            text = request_output.outputs[0].text
+            delta = text[prev_len:]
+            prev_len = len(text)
+            if not delta and not request_output.finished:
+                continue
+            chunk = {
+                "id": request_id,
+                "object": "chat.completion.chunk",
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": delta},
+                    "finish_reason": "stop" if request_output.finished else None
+                }]
+            }
+            yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+    except asyncio.CancelledError:
+        # Starlette cancels the stream when the client disconnects; free the engine slot now
+        await engine.abort(request_id)
+        raise
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band instead of a 500
+        error = {"id": request_id, "error": {"message": f"Generation failed: {str(e)}", "type": "server_error"}}
+        yield b"data: " + orjson.dumps(error) + b"\n\n"
+        return
+    yield b"data: [DONE]\n\n"
+
+
+async def _warmup(engine: AsyncLLMEngine, prompt_lengths: Tuple[int, ...] = (32, 1024), max_tokens: int = 8, max_model_len: int = 2048):
+    """Run short throwaway generations so kernel compilation and CUDA graph capture happen before serving."""
+    max_prompt_len = max_model_len - max_tokens
+    sampling_params = SamplingParams(temperature=0.0, max_tokens=max_tokens)
+    for prompt_len in prompt_lengths:
+        prompt = {"prompt_token_ids": [0] * min(prompt_len, max_prompt_len)}
+        async for _ in engine.generate(prompt, sampling_params, request_id=f"warmup-{uuid4().hex}"):
+            pass
+
+
+async def server_loop(
+    engine: AsyncLLMEngine,
+    queue: asyncio.Queue,
+    max_batch_size: int = 32,
+    max_delay: float = 0.05,
+):
+    """Drain queued requests into batches and submit each batch to the engine together.
+
+    A batch is closed once it holds ``max_batch_size`` requests or ``max_delay``
+    seconds have passed since its first request arrived. All requests in a batch
+    are handed to the engine concurrently so its scheduler sees them in one step.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + max_delay
+        while len(batch) < max_batch_size:
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        
+        # Run the batch in the background so long generations don't hold up the next batch;
+        # gather already schedules each generation, so its future is what we keep alive
+        task = asyncio.gather(*(_generate_one(engine, *item) for item in batch))
+        _batch_tasks.add(task)
+        task.add_done_callback(_batch_tasks.discard)
+
+
+def _fail_pending(queue: asyncio.Queue, exc: BaseException):
+    """Fail every request still waiting in the queue so no caller hangs on its future."""
+    while True:
+        try:
+            *_, future = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        if not future.done():
+            future.set_exception(exc)
+
+
+def _on_batcher_done(queue: asyncio.Queue, task: asyncio.Task):
+    """Report a crashed batcher and release the requests it would have served."""
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error("Request batcher stopped: %r", exc)
+        _fail_pending(queue, HTTPException(status_code=503, detail="Request batcher unavailable"))
+
+
+async def _watch_disconnect(http_request: Request, engine: AsyncLLMEngine, request_id: str, future: asyncio.Future, poll_interval: float = 0.1):
+    """Poll the client connection and abort the generation as soon as it goes away."""
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(poll_interval)
+    future.cancel()
+    try:
+        await engine.abort(request_id)
+    except Exception as e:
+        logger.warning("Failed to abort %s after client disconnect: %s", request_id, e)
+
+
+async def _await_generation(http_request: Request, engine: AsyncLLMEngine, request_id: str, future: asyncio.Future):
+    """Wait for a queued generation, cancelling it if the client disconnects first."""
+    async with asyncio.TaskGroup() as tg:
+        watcher = tg.create_task(_watch_disconnect(http_request, engine, request_id, future))
+        future.add_done_callback(lambda _: watcher.cancel())
+    if future.cancelled():
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    return future.result()
+
+
+def get_engine(request: Request) -> AsyncLLMEngine:
+    """Return the loaded engine, or fail with 503 until lifespan has finished startup."""
+    if not request.app.state.ready:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return request.app.state.llm_engine
+
+
+async def chat_completions(http_request: Request):
+    """OpenAI-compatible chat completions endpoint."""
+    try:
+        request = _chat_request_adapter.validate_json(await http_request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+    
+    # Resolved after body validation so malformed requests still get a 422 during startup
+    engine = get_engine(http_request)
+    state = http_request.app.state
+    
+    # vLLM keys scheduler state by request id, so every generation gets a fresh one;
+    # a caller-supplied X-Request-ID is echoed back for correlation
+    request_id = f"chat-{uuid4().hex}"
+    correlation_headers = {"X-Request-ID": http_request.headers.get("x-request-id", request_id)}
+    
+    # Set up sampling parameters
+    sampling_params = SamplingParams(
+        temperature=request.temperature or 0.7,
+        top_p=request.top_p or 0.9,
+        max_tokens=request.max_tokens or 512,
+    )
+    
+    # Generate response
+    try:
+        prompt_token_ids = build_prompt_token_ids(request.messages, state.tokenizer, state.prefix_token_ids)
+        if request.stream:
+            # Streams go straight to the engine; its scheduler still batches them per step
+            return StreamingResponse(
+                _stream_chat(engine, request_id, prompt_token_ids, sampling_params),
+                media_type="text/event-stream",
+                headers=correlation_headers
+            )
+        
+        future = asyncio.get_running_loop().create_future()
+        await state.request_queue.put((request_id, prompt_token_ids, sampling_params, future))
+        final_output = await _await_generation(http_request, engine, request_id, future)
+        
+        if final_output is None:
+            raise HTTPException(status_code=500, detail="No output generated")
+        
+        generated_text = final_output.outputs[0].text
+        prompt_tokens = len(final_output.prompt_token_ids)
+        completion_tokens = len(final_output.outputs[0].token_ids)
+        
+        payload = {
+            "id": final_output.request_id,
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": generated_text.strip()
+                },
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+        return Response(content=orjson.dumps(payload), media_type="application/json", headers=correlation_headers)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+
+
+def _load_vllm_engine(config_manager: ConfigManager):
+    """Start the vLLM engine, falling back to the demo engine if it can't be initialized."""
+    try:
+        # Get platform-specific vLLM arguments
+        vllm_args = config_manager.get_vllm_args()
+        logger.info("Initializing vLLM with args: %s", vllm_args)
+        
+        # Initialize the engine with platform-specific settings
+        engine_args = AsyncEngineArgs(**vllm_args)
+        llm_engine = AsyncLLMEngine.from_engine_args(engine_args)
+        logger.info("vLLM engine initialized successfully")
+        return llm_engine
+    except Exception as e:
+        logger.error("Failed to initialize vLLM engine: %s; continuing in demo mode", e)
+        return None
+
+
+def create_app(mode: Literal["vllm", "demo"] = "vllm", engine: Optional[Any] = None) -> FastAPI:
+    """Build the server app.
+
+    ``mode="vllm"`` serves a vLLM engine and falls back to the demo engine when
+    vLLM is missing or fails to start; ``mode="demo"`` always uses the demo
+    engine. Passing ``engine`` skips engine construction entirely.
+    """
+    config_manager = get_config()
+    env_vars = config_manager.env_vars
+    demo = mode == "demo"
+    model_name = os.getenv("MODEL_NAME", "demo-model") if demo else env_vars["MODEL_NAME"]
+    version = "1.0.0-demo" if demo else "1.0.0"
+    
+    if not demo and not VLLM_AVAILABLE:
+        logger.warning("vLLM not available (%s); falling back to demo mode", _vllm_import_error)
+    
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """Initialize and cleanup the LLM engine."""
+        
+        configure_logging()
+        
+        # Log platform information
+        logger.info("Platform Configuration:")
+        config_manager.log_platform_info()
+        
+        llm_engine = engine
+        if llm_engine is None and not demo and VLLM_AVAILABLE:
+            llm_engine = _load_vllm_engine(config_manager)
+            # Pay first-request compilation costs now, before the readiness gate opens
+            if llm_engine is not None:
+                try:
+                    await _warmup(llm_engine, max_model_len=env_vars["MAX_MODEL_LEN"])
+                    logger.info("Engine warmed up")
+                except Exception as e:
+                    logger.warning("Warm-up failed, first requests may be slow: %s", e)
+        app.state.using_vllm = llm_engine is not None and engine is None
+        if llm_engine is None:
+            logger.info("Running in demo mode")
+            llm_engine = DemoEngine(delay=env_vars["DEMO_DELAY"])
+        
+        # Tokenize once in the request path and hand the ids straight to the engine
+        tokenizer = await llm_engine.get_tokenizer()
+        app.state.tokenizer = tokenizer
+        app.state.prefix_token_ids = _make_prefix_encoder(tokenizer)
+        
+        # vLLM already batches continuously, so only the demo engine waits to fill a batch
+        app.state.request_queue = asyncio.Queue()
+        batcher = asyncio.create_task(server_loop(
+            llm_engine,
+            app.state.request_queue,
+            max_batch_size=env_vars["MAX_BATCH_SIZE"],
+            max_delay=0.0 if app.state.using_vllm else env_vars["MAX_BATCH_DELAY"],
+        ))
+        batcher.add_done_callback(partial(_on_batcher_done, app.state.request_queue))
+        
+        app.state.llm_engine = llm_engine
+        app.state.ready = True
+        
+        yield
+        
+        # Cleanup
+        app.state.ready = False
+        batcher.cancel()
+        for task in list(_batch_tasks):
+            task.cancel()
+        _fail_pending(app.state.request_queue, HTTPException(status_code=503, detail="Server shutting down"))
+        app.state.llm_engine = None
+    
+    app = FastAPI(
+        title="vLLM PoC Server (Demo)" if demo else "vLLM PoC Server",
+        description=f"A proof of concept server for vLLM inference (Platform: {config_manager.config.name})",
+        version=version,
+        lifespan=lifespan
+    )
+    app.state.ready = False
+    app.state.llm_engine = None
+    app.state.using_vllm = False
+    
+    # Add CORS middleware
+    app.add_middleware(
+        CORSAllowlistMiddleware,
+        allow_origins=env_vars["CORS_ALLOW_ORIGINS"],
+    )
+    
+    # Get platform-specific GPU info
+    if config_manager.config.supports_cuda:
+        gpu_info = "CUDA enabled"
+    elif config_manager.config.supports_mps:
+        gpu_info = "MPS (Apple Silicon) enabled"
+    else:
+        gpu_info = "CPU only"
+    
+    @app.get("/health", response_model=HealthResponse)
+    async def health_check(request: Request, engine: AsyncLLMEngine = Depends(get_engine)):
+        """Health check endpoint."""
+        return HealthResponse(
+            status="healthy" if request.app.state.using_vllm else "demo_mode",
+            model=model_name,
+            gpu_memory_used=gpu_info
+        )
+    
+    app.add_api_route(
+        "/v1/chat/completions",
+        chat_completions,
+        methods=["POST"],
+        # Documented but not re-validated on the way out; the payload is built right here
+        response_model=None,
+        responses={200: {"model": ChatResponse}},
+        openapi_extra={"requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _inline_schema(ChatRequest.model_json_schema())}},
+        }},
+    )
+    
+    # Constant payloads, encoded once so these endpoints just copy bytes
+    models_body = orjson.dumps({
+        "object": "list",
+        "data": [{
+            "id": model_name,
+            "object": "model",
+            "created": 1677610602,
+            "owned_by": "vllm-poc-demo" if demo else "vllm-poc"
+        }]
+    })
+    root_body = orjson.dumps({
+        "message": "vLLM PoC Server Demo" if demo else "vLLM PoC Server",
+        "version": version,
+        "endpoints": {
+            "health": "/health",
+            "chat": "/v1/chat/completions",
+            "models": "/models",
+            "docs": "/docs"
+        },
+        **({"note": "This is a demo version. The real implementation uses vLLM for GPU-accelerated inference."} if demo else {}),
+    })
+    
+    @app.get("/models")
+    async def list_models():
+        """List available models."""
+        return Response(content=models_body, media_type="application/json")
+    
+    @app.get("/")
+    async def root():
+        """Root endpoint with server information."""
+        return Response(content=root_body, media_type="application/json")
+    
+    return app
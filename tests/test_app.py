@@ -1,82 +1,313 @@
 """Tests for the vLLM PoC application."""
 
-import pytest
-from fastapi.testclient import TestClient
-from unittest.mock import AsyncMock, patch
-import sys
-import os
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
 
-# Add the parent directory to the path so we can import app
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import orjson
+import pytest
+from fastapi import HTTPException
+from httpx import ASGITransport, AsyncClient
+from unittest.mock import patch
 
 from app import app
+from server import create_app, server_loop, _await_generation, _warmup, _format_turns, _make_prefix_encoder, build_prompt_token_ids, ChatMessage
+
+pytestmark = pytest.mark.api
+
+
+# Request bodies shared across tests, serialized once
+_JSON_HDRS = {"content-type": "application/json"}
+_VALID_CHAT = orjson.dumps({"messages": [{"role": "user", "content": "Hello"}]})
+_INVALID_CHAT = orjson.dumps({"messages": "invalid"})
+_STREAM_CHAT = orjson.dumps({"messages": [{"role": "user", "content": "Hello"}], "stream": True})
+
+
+@pytest.fixture(scope="session")
+async def client():
+    """Create one test client for the whole session; it never runs lifespan, so the app stays unready."""
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture(scope="session", autouse=True)
+async def _warm_client(client):
+    """Prime routing and validators with one cheap request before any test runs."""
+    await client.get("/models")
+
+
+@pytest.fixture(autouse=True)
+def _reset_overrides():
+    """Keep dependency overrides from leaking between tests that share the client."""
+    yield
+    app.dependency_overrides.clear()
+
+
+@asynccontextmanager
+async def _serving(app):
+    """Run the app's lifespan (ASGITransport does not) and yield a client for it."""
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            yield ac
+
+
+class _StreamingEngine:
+    """Engine stub that produces a reply over several steps, optionally failing midway."""
+    
+    def __init__(self, texts, error=None):
+        self.texts = texts
+        self.error = error
+    
+    async def get_tokenizer(self):
+        return SimpleNamespace(encode=lambda text, add_special_tokens=True: [0])
+    
+    async def generate(self, prompt, sampling_params, request_id):
+        for i, text in enumerate(self.texts):
+            output = SimpleNamespace(text=text, token_ids=[0] * len(text))
+            yield SimpleNamespace(
+                request_id=request_id,
+                finished=i == len(self.texts) - 1 and self.error is None,
+                prompt_token_ids=prompt["prompt_token_ids"],
+                outputs=[output],
+            )
+        if self.error is not None:
+            raise self.error
+
 
+def _sse_events(body: str):
+    """Split a server-sent event stream into its data payloads."""
+    return [event[len("data: "):] for event in body.split("\n\n") if event]
 
-@pytest.fixture
-def client():
-    """Create a test client."""
-    return TestClient(app)
 
+class _FakeEngine:
+    """Engine stub that answers every request with the same finished output."""
+    
+    output = SimpleNamespace(
+        request_id="test-123",
+        finished=True,
+        prompt_token_ids=[1, 2, 3],
+        outputs=[SimpleNamespace(text="Hello! How can I help you today?", token_ids=[4, 5, 6, 7])],
+    )
+    
+    async def get_tokenizer(self):
+        return SimpleNamespace(encode=lambda text, add_special_tokens=True: [0])
+    
+    async def generate(self, prompt, sampling_params, request_id):
+        yield self.output
+    
+    async def abort(self, request_id):
+        pass
 
-@pytest.fixture
+
+@pytest.fixture(scope="module")
 def mock_llm_engine():
     """Mock the LLM engine for testing."""
-    mock_engine = AsyncMock()
-    mock_output = AsyncMock()
-    mock_output.request_id = "test-123"
-    mock_output.outputs = [AsyncMock()]
-    mock_output.outputs[0].text = "Hello! How can I help you today?"
+    return _FakeEngine()
+
+
+async def test_health_without_model(client):
+    """Test health endpoint when model is not loaded."""
+    response = await client.get("/health")
+    assert response.status_code == 503
+    assert b"Model not loaded" in response.content
+
+
+async def test_list_models(client):
+    """Test the models endpoint."""
+    response = await client.get("/models")
+    assert response.status_code == 200
+    data = orjson.loads(response.content)
+    assert data["object"] == "list"
+    assert len(data["data"]) > 0
+    assert "id" in data["data"][0]
+
+
+@pytest.mark.parametrize("payload,status,needle", [
+    (_INVALID_CHAT, 422, b'"loc":["body","messages"]'),
+    (_VALID_CHAT, 503, b"Model not loaded"),
+], ids=["invalid-request", "without-model"])
+async def test_chat_completions_errors(client, payload, status, needle):
+    """Test that a malformed body gets a 422 even before startup, and a valid one a 503."""
+    with patch.object(app.state, "ready", False):
+        response = await client.post("/v1/chat/completions", content=payload, headers=_JSON_HDRS)
+    assert response.status_code == status
+    assert needle in response.content
+
+
+async def test_chat_completions_serves_sequential_requests():
+    """Test that the app keeps answering once its first batch has completed."""
+    async with _serving(app) as client:
+        for _ in range(2):
+            response = await client.post("/v1/chat/completions", content=_VALID_CHAT, headers=_JSON_HDRS)
+            assert response.status_code == 200
+
+
+async def test_chat_completions_usage_counts_engine_tokens(mock_llm_engine):
+    """Test that usage is taken from the engine's prompt and completion token ids."""
+    async with _serving(create_app("demo", engine=mock_llm_engine)) as client:
+        response = await client.post("/v1/chat/completions", content=_VALID_CHAT, headers=_JSON_HDRS)
+    assert response.status_code == 200
+    assert response.json()["usage"] == {"prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7}
+
+
+async def test_chat_completions_streams_deltas():
+    """Test that streaming sends only new text per event and ends with [DONE]."""
+    engine = _StreamingEngine(["Hel", "Hel", "Hello", "Hello!"])
+    async with _serving(create_app("demo", engine=engine)) as client:
+        response = await client.post("/v1/chat/completions", content=_STREAM_CHAT, headers=_JSON_HDRS)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    *chunks, done = _sse_events(response.text)
+    choices = [json.loads(chunk)["choices"][0] for chunk in chunks]
+    assert [choice["delta"]["content"] for choice in choices] == ["Hel", "lo", "!"]
+    assert [choice["finish_reason"] for choice in choices] == [None, None, "stop"]
+    assert done == "[DONE]"
+
+
+async def test_chat_completions_stream_reports_engine_error():
+    """Test that an engine failure mid-stream ends the stream with an error event."""
+    engine = _StreamingEngine(["Hel"], error=RuntimeError("boom"))
+    async with _serving(create_app("demo", engine=engine)) as client:
+        response = await client.post("/v1/chat/completions", content=_STREAM_CHAT, headers=_JSON_HDRS)
+    events = _sse_events(response.text)
+    assert json.loads(events[0])["choices"][0]["delta"]["content"] == "Hel"
+    assert "boom" in json.loads(events[-1])["error"]["message"]
+    assert "[DONE]" not in events
+
+
+async def test_demo_app_replies_with_user_message():
+    """Test that the demo engine builds its reply from the last user turn."""
+    async with _serving(create_app("demo")) as client:
+        response = await client.post("/v1/chat/completions", json={
+            "messages": [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hey"}, {"role": "user", "content": "Ping"}]
+        })
+    assert response.status_code == 200
+    assert "'Ping'" in response.json()["choices"][0]["message"]["content"]
+
+
+async def test_chat_completions_echoes_request_id():
+    """Test that a caller-supplied X-Request-ID comes back while the completion id stays unique."""
+    async with _serving(app) as client:
+        responses = [
+            await client.post(
+                "/v1/chat/completions",
+                content=_VALID_CHAT,
+                headers={**_JSON_HDRS, "X-Request-ID": "trace-1"},
+            )
+            for _ in range(2)
+        ]
+    assert [r.headers["x-request-id"] for r in responses] == ["trace-1", "trace-1"]
+    assert responses[0].json()["id"] != responses[1].json()["id"]
+
+
+async def test_preflight_answered_without_routing(client):
+    """Test that a preflight gets a 204 with the caller's origin echoed."""
+    response = await client.options("/v1/chat/completions", headers={
+        "Origin": "http://example.com",
+        "Access-Control-Request-Method": "POST",
+    })
+    assert response.status_code == 204
+    assert response.headers["access-control-allow-origin"] == "http://example.com"
+    assert "POST" in response.headers["access-control-allow-methods"]
+
+
+async def test_response_carries_allowed_origin(client):
+    """Test that regular responses are tagged for an allowed origin."""
+    response = await client.get("/models", headers={"Origin": "http://example.com"})
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "http://example.com"
+
+
+async def test_warmup_runs_each_prompt_length():
+    """Test that warm-up generates once per representative prompt length."""
+    engine = _StreamingEngine(["ok"])
+    seen = []
+    generate = engine.generate
     
-    async def mock_generate(*args, **kwargs):
-        yield mock_output
+    def recording_generate(prompt, sampling_params, request_id):
+        seen.append(len(prompt["prompt_token_ids"]))
+        return generate(prompt, sampling_params, request_id)
     
-    mock_engine.generate = mock_generate
-    return mock_engine
+    engine.generate = recording_generate
+    await _warmup(engine, prompt_lengths=(32, 64))
+    assert seen == [32, 64]
 
 
-class TestHealthEndpoint:
-    """Test the health check endpoint."""
+async def test_disconnect_aborts_generation():
+    """Test that a disconnected client cancels its pending generation and aborts it in the engine."""
+    aborted = []
     
-    def test_health_endpoint_without_model(self, client):
-        """Test health endpoint when model is not loaded."""
-        response = client.get("/health")
-        assert response.status_code == 503
-        assert "Model not loaded" in response.json()["detail"]
+    async def abort(request_id):
+        aborted.append(request_id)
+    
+    async def is_disconnected():
+        return True
+    
+    future = asyncio.get_running_loop().create_future()
+    http_request = SimpleNamespace(is_disconnected=is_disconnected)
+    engine = SimpleNamespace(abort=abort)
+    with pytest.raises(HTTPException) as exc_info:
+        await asyncio.wait_for(_await_generation(http_request, engine, "chat-1", future), timeout=5)
+    
+    assert exc_info.value.status_code == 499
+    assert future.cancelled()
+    assert aborted == ["chat-1"]
 
 
-class TestModelsEndpoint:
-    """Test the models listing endpoint."""
-    
-    def test_list_models(self, client):
-        """Test the models endpoint."""
-        response = client.get("/models")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["object"] == "list"
-        assert len(data["data"]) > 0
-        assert "id" in data["data"][0]
+async def test_server_loop_resolves_queued_requests(mock_llm_engine):
+    """Test that every queued request gets its own generated output."""
+    queue = asyncio.Queue()
+    batcher = asyncio.create_task(server_loop(mock_llm_engine, queue, max_delay=0.01))
+    futures = [asyncio.get_running_loop().create_future() for _ in range(3)]
+    for i, future in enumerate(futures):
+        queue.put_nowait((f"chat-{i}", [1, 2, 3], None, future))
+    try:
+        outputs = await asyncio.wait_for(asyncio.gather(*futures), timeout=5)
+    finally:
+        batcher.cancel()
+    assert [output.outputs[0].text for output in outputs] == ["Hello! How can I help you today?"] * 3
 
 
-class TestChatEndpoint:
-    """Test the chat completions endpoint."""
+async def test_server_loop_keeps_serving_after_first_batch(mock_llm_engine):
+    """Test that a request arriving after the first batch was dispatched is still served."""
+    queue = asyncio.Queue()
+    batcher = asyncio.create_task(server_loop(mock_llm_engine, queue, max_delay=0.01))
+    try:
+        outputs = []
+        for _ in range(2):
+            future = asyncio.get_running_loop().create_future()
+            queue.put_nowait((f"chat-{len(outputs)}", [1, 2, 3], None, future))
+            outputs.append(await asyncio.wait_for(future, timeout=5))
+        assert not batcher.done()
+    finally:
+        batcher.cancel()
+    assert [output.request_id for output in outputs] == ["test-123"] * 2
+
+
+def test_format_turns_skips_unknown_roles():
+    """Test that only user and assistant turns are rendered, in order."""
+    turns = [("system", "Be brief."), ("user", "Hi"), ("assistant", "Hello!")]
+    assert _format_turns(turns) == "User: Hi\nAssistant: Hello!\n"
+
+
+def test_prefix_cache_reused_by_follow_up_turn():
+    """Test that the next turn of a conversation hits the cached history of the previous one."""
+    class ByteTokenizer:
+        def encode(self, text, add_special_tokens=True):
+            return list(text.encode("utf-8"))
     
-    @patch('app.llm_engine')
-    def test_chat_completions_without_model(self, mock_engine, client):
-        """Test chat endpoint when model is not loaded."""
-        mock_engine = None
-        
-        response = client.post("/v1/chat/completions", json={
-            "messages": [{"role": "user", "content": "Hello"}]
-        })
-        assert response.status_code == 503
-        assert "Model not loaded" in response.json()["detail"]
+    tokenizer = ByteTokenizer()
+    prefix_token_ids = _make_prefix_encoder(tokenizer)
+    first = [ChatMessage(role="user", content="Hi")]
+    second = first + [ChatMessage(role="assistant", content="Hello!"), ChatMessage(role="user", content="Bye")]
     
-    def test_chat_completions_invalid_request(self, client):
-        """Test chat endpoint with invalid request."""
-        response = client.post("/v1/chat/completions", json={
-            "messages": "invalid"
-        })
-        assert response.status_code == 422
+    build_prompt_token_ids(first, tokenizer, prefix_token_ids)
+    hits = prefix_token_ids.cache_info().hits
+    prompt = build_prompt_token_ids(second, tokenizer, prefix_token_ids)
+    
+    assert prefix_token_ids.cache_info().hits > hits
+    assert bytes(prompt) == b"User: Hi\nAssistant: Hello!\nUser: Bye\nAssistant:"
 
 
 if __name__ == "__main__":